@@ -20,6 +20,15 @@ def main():
     KSAT_FILE = "ksat_table_inc_divides.parquet"
     OUTLET_DISCHARGE_FILE = "daily_discharge.parquet"
     MANNING_PARAMS_FILE = "manning_parameters.parquet" # This one is optional
+    # Only read the columns the workflow uses (GeoPackage geometry is always read)
+    COLUMNS_BY_FILE = {
+        'flowlines': ['flowline_id', 'to_id', 'drainage_area', 'area_incr'],
+        'divides': ['flowline_id'],
+        'precipitation': ['flowline_id', 'time', 'prcp_sum'],
+        'ksat': ['flowline_id', 'ksat'],
+        'outlet_discharge': ['time', 'discharge'],
+        'manning_params': ['flowline_id', 'slope', 'mannings_n', 'channel_area', 'wetted_perimeter'],
+    }
 
     try:
         flowlines, divides, raw_precip, ksat_table, outlet_q, manning_params = load_all_data(
@@ -29,7 +38,8 @@ def main():
             precipitation_file=PRECIPITATION_FILE,
             ksat_file=KSAT_FILE,
             outlet_discharge_file=OUTLET_DISCHARGE_FILE,
-            manning_params_file=MANNING_PARAMS_FILE
+            manning_params_file=MANNING_PARAMS_FILE,
+            columns_by_file=COLUMNS_BY_FILE
         )
         
         aggregated_rain_df = process_precipitation_data(
@@ -61,14 +71,22 @@ def main():
         )
         print(f"Disaggregation complete. Generated label: {final_label}")
 
-        # Save Outputs to CSV Files  
-        print(f"\nSaving results to CSV files in '{DATA_PATH}' directory...")
+        # Save Outputs to Parquet Files  
+        print(f"\nSaving results to Parquet files in '{DATA_PATH}' directory...")
         
-        disaggregated_output_path = DATA_PATH / f"disaggregated_discharge_{final_label}.csv"
-        intermediate_calcs_output_path = DATA_PATH / f"flowline_calculations_{final_label}.csv"
+        disaggregated_output_path = DATA_PATH / f"disaggregated_discharge_{final_label}.parquet"
+        intermediate_calcs_output_path = DATA_PATH / f"flowline_calculations_{final_label}.parquet"
 
-        final_disaggregated_gdf.drop(columns='geometry').to_csv(disaggregated_output_path, index=False)
-        flowlines_with_calcs_gdf.drop(columns='geometry').to_csv(intermediate_calcs_output_path, index=False)
+        # Discharge time series without geometry; time-sorted row groups allow row-group skipping downstream
+        (
+            final_disaggregated_gdf.drop(columns='geometry')
+            .sort_values('time', kind='stable')
+            .to_parquet(disaggregated_output_path, index=False, compression='zstd', row_group_size=200_000)
+        )
+        # Flowlines as GeoParquet with a bbox covering column for fast spatial filtering
+        flowlines_with_calcs_gdf.to_parquet(
+            intermediate_calcs_output_path, index=False, compression='zstd', write_covering_bbox=True
+        )
         
         print(f"Saved final disaggregated discharge to: {disaggregated_output_path}")
         print(f"Saved intermediate calculations to: {intermediate_calcs_output_path}")
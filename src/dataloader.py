@@ -2,8 +2,61 @@
 
 import pandas as pd
 import geopandas as gpd
+import shapely
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+
+def _numeric_id_cols(df: pd.DataFrame, id_cols: tuple) -> list:
+    """Returns the names in `id_cols` that are numeric columns of `df`."""
+    return [col for col in id_cols if col in df.columns and pd.api.types.is_numeric_dtype(df[col])]
+
+
+def narrowest_id_dtype(frames: list, id_cols: tuple = ('flowline_id', 'to_id')) -> str:
+    """
+    Picks the narrowest nullable integer type that holds every ID value across several
+    DataFrames ('Int32' when possible, otherwise 'Int64').
+
+    Args:
+        frames (list): The DataFrames whose ID columns will be joined against each other.
+        id_cols (tuple): Names of the ID columns. Columns that are missing or not numeric are skipped.
+
+    Returns:
+        str: 'Int32' or 'Int64'.
+    """
+    int32 = np.iinfo(np.int32)
+    for df in frames:
+        for col in _numeric_id_cols(df, id_cols):
+            min_val, max_val = df[col].min(), df[col].max()
+            if not pd.isna(min_val) and (min_val < int32.min or max_val > int32.max):
+                return 'Int64'
+    return 'Int32'
+
+
+def normalize_ids(df: pd.DataFrame, id_cols: tuple = ('flowline_id', 'to_id'), id_dtype: str = None) -> pd.DataFrame:
+    """
+    Casts the numeric ID columns of a DataFrame to a nullable integer type.
+
+    Narrower keys halve the hash-table memory of merges, groupbys and joins. Frames
+    that will be joined together should share one `id_dtype` (see `narrowest_id_dtype`)
+    so the joins never need upcasting.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to normalize; modified in place.
+        id_cols (tuple): Names of the ID columns. Columns that are missing or not numeric are skipped.
+        id_dtype (str, optional): Target dtype. Defaults to the narrowest type that fits this DataFrame.
+
+    Returns:
+        pd.DataFrame: The same DataFrame with normalized ID columns.
+    """
+    id_dtype = id_dtype or narrowest_id_dtype([df], id_cols)
+    for col in _numeric_id_cols(df, id_cols):
+        df[col] = df[col].astype(id_dtype)
+
+    return df
+
+
 def load_all_data(
     data_path: Path,
     flowlines_file: str,
@@ -11,7 +64,8 @@ def load_all_data(
     precipitation_file: str,
     ksat_file: str,
     outlet_discharge_file: str,
-    manning_params_file: str = None
+    manning_params_file: str = None,
+    columns_by_file: dict = None
 ) -> tuple:
     """
     Loads all necessary data files for the discharge disaggregation workflow.
@@ -27,44 +81,78 @@ def load_all_data(
         outlet_discharge_file (str): Filename of the outlet discharge Parquet file.
         manning_params_file (str, optional): Filename of the Manning's parameters Parquet file.
                                              If None, this file will not be loaded. Defaults to None.
+        columns_by_file (dict, optional): Columns to read for each input, keyed by 'flowlines', 'divides',
+                                          'precipitation', 'ksat', 'outlet_discharge' or 'manning_params'.
+                                          GeoPackage geometry is always read. Inputs without an entry
+                                          are read in full. Defaults to None.
 
     Returns:
         tuple: A tuple containing all the loaded DataFrames and GeoDataFrames:
                (flowlines_gdf, divides_gdf, precip_df, ksat_df, 
                 outlet_discharge_df, manning_params_df). 
+               `flowlines_gdf` includes a precomputed 'length_m' column, and numeric
+               'flowline_id' / 'to_id' columns in all frames are cast to one shared
+               dtype with `normalize_ids`.
                `manning_params_df` will be None if the file is not provided.
                
     Raises:
         FileNotFoundError: If any of the required files are not found.
     """
     print("Loading all input data...")
+    columns_by_file = columns_by_file or {}
     
-    def _load_file(filename, file_type, layer):
+    def _load_file(filename, file_type, layer=None, columns=None):
         full_path = data_path / filename
         if not full_path.exists():
             raise FileNotFoundError(f"Required data file not found: {full_path}")
         
-        print(f"Reading {filename}...")
         if file_type == 'geopackage':
-            return gpd.read_file(full_path, layer=layer)
+            return gpd.read_file(full_path, layer=layer, engine='pyogrio', columns=columns)
         elif file_type == 'parquet':
-            return pd.read_parquet(full_path)
+            return pd.read_parquet(full_path, columns=columns, engine='pyarrow')
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
 
-    # Load all files
-    flowlines_gdf = _load_file(flowlines_file, 'geopackage', 'flowlines')
-    divides_gdf = _load_file(divides_file, 'geopackage', 'incremental_divides')
-    precip_df = _load_file(precipitation_file, 'parquet')
-    ksat_df = _load_file(ksat_file, 'parquet')
-    outlet_discharge_df = _load_file(outlet_discharge_file, 'parquet')
-    
-    # Load optional Manning's file
-    manning_params_df = None
+    # Load all files concurrently; pyogrio and pyarrow release the GIL while reading
+    file_specs = {
+        'flowlines': (flowlines_file, 'geopackage', 'flowlines'),
+        'divides': (divides_file, 'geopackage', 'incremental_divides'),
+        'precipitation': (precipitation_file, 'parquet', None),
+        'ksat': (ksat_file, 'parquet', None),
+        'outlet_discharge': (outlet_discharge_file, 'parquet', None),
+    }
     if manning_params_file:
-        try:
-            manning_params_df = _load_file(manning_params_file, 'parquet')
-        except FileNotFoundError:
-            print(f"Optional Manning's parameter file not found: {manning_params_file}. Will proceed without it.")
+        file_specs['manning_params'] = (manning_params_file, 'parquet', None)
+
+    # Report progress from the main thread; prints from the workers would interleave
+    with ThreadPoolExecutor(max_workers=len(file_specs)) as executor:
+        futures = {}
+        for name, (filename, file_type, layer) in file_specs.items():
+            print(f"Reading {filename}...")
+            futures[name] = executor.submit(_load_file, filename, file_type, layer, columns_by_file.get(name))
+
+        flowlines_gdf = futures['flowlines'].result()
+        # Segment lengths only depend on geometry; compute them once here rather than per disaggregation run
+        if 'length_m' not in flowlines_gdf.columns:
+            flowlines_gdf['length_m'] = shapely.length(flowlines_gdf.geometry.values.to_numpy())
+        divides_gdf = futures['divides'].result()
+        precip_df = futures['precipitation'].result()
+        ksat_df = futures['ksat'].result()
+        outlet_discharge_df = futures['outlet_discharge'].result()
+    
+        # Load optional Manning's file
+        manning_params_df = None
+        if manning_params_file:
+            try:
+                manning_params_df = futures['manning_params'].result()
+            except FileNotFoundError:
+                print(f"Optional Manning's parameter file not found: {manning_params_file}. Will proceed without it.")
+
+    # One ID dtype across all inputs, so joins between them never upcast
+    loaded_frames = [df for df in (flowlines_gdf, divides_gdf, precip_df, ksat_df, outlet_discharge_df, manning_params_df)
+                     if df is not None]
+    id_dtype = narrowest_id_dtype(loaded_frames)
+    for df in loaded_frames:
+        normalize_ids(df, id_dtype=id_dtype)
     
     return flowlines_gdf, divides_gdf, precip_df, ksat_df, outlet_discharge_df, manning_params_df
\ No newline at end of file
@@ -2,28 +2,284 @@
 
 import pandas as pd
 import geopandas as gpd
+import shapely
 import numpy as np
 import warnings
+from numba import njit, prange
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import Tuple
+from src.dataloader import narrowest_id_dtype, normalize_ids
 
-def _get_total_travel_time(flowline_id: int, time_map: dict, to_map: dict, outlet_id: int=-1) -> float:
+
+@njit(parallel=True, cache=True)
+def _scale_to_1_10(values: np.ndarray) -> np.ndarray:
     """
-    Sum travel time down to the outlet.
-    
+    Min-max scales an array to the 1-10 range without intermediate arrays, ignoring NaNs for the range.
+
+    Args:
+        values (np.ndarray): The values to scale.
+
+    Returns:
+        np.ndarray: The scaled values; NaNs stay NaN.
+    """
+    min_val = np.inf
+    max_val = -np.inf
+    for v in values:
+        if not np.isnan(v):
+            min_val = min(min_val, v)
+            max_val = max(max_val, v)
+
+    scaled = np.empty_like(values)
+    span = max_val - min_val + 1e-9
+    for i in prange(values.size):
+        scaled[i] = 1 + (values[i] - min_val) * 9 / span
+    return scaled
+
+
+@njit(parallel=True, cache=True)
+def _influence_score(
+    area: np.ndarray, runoff_coeff: np.ndarray, prcp: np.ndarray, ksat: np.ndarray,
+    alpha: float, beta: float, gamma: float, omega: float
+) -> np.ndarray:
+    """
+    Evaluates (area^alpha * rc^beta * prcp^gamma) / (ksat^omega + 1e-9) in one fused pass.
+
+    Args:
+        area (np.ndarray): Drainage or incremental area.
+        runoff_coeff (np.ndarray): Average runoff coefficient.
+        prcp (np.ndarray): Precipitation sum.
+        ksat (np.ndarray): Saturated hydraulic conductivity.
+        alpha, beta, gamma, omega (float): Exponents for each term.
+
+    Returns:
+        np.ndarray: The influence score for each row.
+    """
+    score = np.empty_like(area)
+    for i in prange(area.size):
+        score[i] = (area[i]**alpha * runoff_coeff[i]**beta * prcp[i]**gamma) / (ksat[i]**omega + 1e-9)
+    return score
+
+
+def _get_total_travel_time(flowline_ids: pd.Series, to_ids: pd.Series, segment_times: pd.Series) -> np.ndarray:
+    """
+    Sum travel time down to the outlet for every flowline in a single pass.
+
+    Flowlines are peeled off the network in topological levels (headwaters first),
+    then travel times are accumulated level by level from the outlet upstream, so
+    each flowline adds its segment time to the already-finished downstream total.
+    Flowlines whose 'to_id' is not in the network are treated as outlets.
+
+    Args:
+        flowline_ids (pd.Series): The flowline IDs.
+        to_ids (pd.Series): The downstream flowline ID of each flowline.
+        segment_times (pd.Series): The segment travel time of each flowline in seconds.
+
+    Returns:
+        np.ndarray: The total travel time from each flowline to the basin outlet in seconds.
+
+    Raises:
+        ValueError: If the flowline IDs are not unique or the flowline network contains a cycle.
+    """
+    flowline_index = pd.Index(flowline_ids)
+    if not flowline_index.is_unique:
+        duplicates = flowline_index[flowline_index.duplicated()].unique().tolist()
+        raise ValueError(f"Flowline IDs must be unique to compute travel time to the outlet; duplicated: {duplicates}")
+
+    to_idx = flowline_index.get_indexer(to_ids)
+    n_flowlines = len(to_idx)
+
+    # Kahn's algorithm, one vectorized step per topological level
+    indegree = np.bincount(to_idx[to_idx >= 0], minlength=n_flowlines)
+    levels = []
+    n_visited = 0
+    frontier = np.flatnonzero(indegree == 0)
+    while frontier.size:
+        levels.append(frontier)
+        n_visited += frontier.size
+        downstream = to_idx[frontier]
+        downstream = downstream[downstream >= 0]
+        np.subtract.at(indegree, downstream, 1)
+        frontier = np.unique(downstream[indegree[downstream] == 0])
+
+    if n_visited < n_flowlines:
+        raise ValueError("Flowline network contains a cycle; cannot compute travel time to the outlet.")
+
+    total_time = np.asarray(segment_times, dtype=float).copy()
+    for level in reversed(levels):
+        downstream = to_idx[level]
+        has_downstream = downstream >= 0
+        total_time[level[has_downstream]] += total_time[downstream[has_downstream]]
+
+    return total_time
+
+
+_TRAVEL_TIME_CACHE = {}
+_TRAVEL_TIME_CACHE_SIZE = 8
+
+
+def _fingerprint(df: pd.DataFrame) -> tuple:
+    """
+    Content hash of a DataFrame, used to key the travel time cache.
+
     Args:
-        flowline_id (int): The starting flowline ID.
-        time_map (dict): A dictionary mapping flowline_id to its segment travel time.
-        to_map (dict): A dictionary mapping flowline_id to its downstream flowline_id.
+        df (pd.DataFrame): The DataFrame to hash (non-geometry columns only).
 
     Returns:
-        float: The total travel time from the flowline to the basin outlet in seconds.
+        tuple: The column names, row count and a 64-bit hash of the values.
     """
-    if flowline_id == outlet_id:  # Reached the outlet (not needed for now)
-        return 0
-    current_segment_time = time_map.get(flowline_id, 0)
-    downstream_id = to_map.get(flowline_id, -1)
+    return tuple(df.columns), len(df), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def _compute_travel_time(flowlines_gdf: gpd.GeoDataFrame, manning_params_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Calculates Manning's velocity, segment travel time and total travel time to the outlet for each flowline.
+
+    The result depends only on the flowline network and the Manning's parameters, so it is
+    memoized on a content hash of both; repeated calls during parameter sweeps reuse it.
+
+    Args:
+        flowlines_gdf (gpd.GeoDataFrame): GeoDataFrame of flowlines with 'flowline_id' and 'to_id'.
+            A precomputed 'length_m' column is used if present; otherwise lengths come from the geometry.
+        manning_params_df (pd.DataFrame, optional): DataFrame with Manning's parameters per 'flowline_id'.
+            If None, hardcoded placeholders are used. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per flowline with 'flowline_id', the Manning's parameters, 'length_m',
+        'hydraulic_radius', 'velocity_mps', 'segment_travel_time_s', 'total_travel_time_s'
+        and 'travel_time_days'.
+    """
+    travel_df = flowlines_gdf[['flowline_id', 'to_id']].copy()
+    if 'length_m' in flowlines_gdf.columns:
+        travel_df['length_m'] = flowlines_gdf['length_m'].to_numpy()
+    else:
+        travel_df['length_m'] = shapely.length(flowlines_gdf.geometry.values.to_numpy())
+
+    cache_key = (
+        _fingerprint(travel_df),
+        None if manning_params_df is None else _fingerprint(manning_params_df)
+    )
+    if cache_key in _TRAVEL_TIME_CACHE:
+        return _TRAVEL_TIME_CACHE[cache_key].copy()
+
+    if manning_params_df is None:
+        travel_df['slope'] = 0.01
+        travel_df['mannings_n'] = 0.02
+        travel_df['channel_area'] = 10
+        travel_df['wetted_perimeter'] = 9
+    else:
+        travel_df = travel_df.merge(manning_params_df, on='flowline_id', how='left')
+
+    travel_df['hydraulic_radius'] = travel_df['channel_area'] / travel_df['wetted_perimeter']
+    travel_df['velocity_mps'] = (
+        (1 / travel_df['mannings_n']) *
+        (travel_df['hydraulic_radius'] ** (2/3)) *
+        (travel_df['slope'] ** 0.5)
+    )
+    travel_df['segment_travel_time_s'] = travel_df['length_m'] / travel_df['velocity_mps']
+
+    travel_df['total_travel_time_s'] = _get_total_travel_time(
+        travel_df['flowline_id'],
+        travel_df['to_id'],
+        travel_df['segment_travel_time_s']
+    )
+    travel_df['travel_time_days'] = (travel_df['total_travel_time_s'] / (3600 * 24)).round().astype(int)
+    travel_df = travel_df.drop(columns='to_id')
+
+    if len(_TRAVEL_TIME_CACHE) >= _TRAVEL_TIME_CACHE_SIZE:
+        _TRAVEL_TIME_CACHE.pop(next(iter(_TRAVEL_TIME_CACHE)))
+    _TRAVEL_TIME_CACHE[cache_key] = travel_df
+
+    return travel_df.copy()
+
+
+def _compute_runoff_weights(
+    runoff_gdf: gpd.GeoDataFrame,
+    ksat_df: pd.DataFrame,
+    precipitation_df: pd.DataFrame,
+    flowlines_gdf: gpd.GeoDataFrame,
+    area_label: str,
+    alpha: float,
+    beta: float,
+    gamma: float,
+    omega: float,
+    scale_inputs: bool
+) -> pd.DataFrame:
+    """
+    Calculates the influence score and normalized runoff weight for each flowline.
+
+    Args:
+        runoff_gdf (gpd.GeoDataFrame): GDF with runoff coefficients ('avg_runoff_coeff') and 'flowline_id'.
+        ksat_df (pd.DataFrame): DataFrame with Ksat values ('ksat') and 'flowline_id'.
+        precipitation_df (pd.DataFrame): DataFrame with precipitation data ('prcp_sum') and 'flowline_id'.
+        flowlines_gdf (gpd.GeoDataFrame): GeoDataFrame of flowlines with 'flowline_id' and the area column.
+        area_label (str): Name of the area column ('drainage_area' or 'area_incr').
+        alpha (float): Exponent for the area term.
+        beta (float): Exponent for the runoff coefficient term.
+        gamma (float): Exponent for the precipitation term.
+        omega (float): Exponent for the hydraulic conductivity (Ksat) term.
+        scale_inputs (bool): If True, scales ksat, precipitation, and area to a 1-10 range before scoring.
+
+    Returns:
+        pd.DataFrame: DataFrame with 'flowline_id', 'runoff_weight' and 'influence_score'.
+    """
+    # One index-aligned join instead of a chain of merges on 'flowline_id'
+    merged_df = runoff_gdf[['flowline_id', 'avg_runoff_coeff']].set_index('flowline_id').join(
+        [
+            ksat_df.set_index('flowline_id')[['ksat']],
+            precipitation_df.set_index('flowline_id'),
+            flowlines_gdf.set_index('flowline_id')[[area_label]]
+        ],
+        how='left'
+    ).reset_index()
+
+    score_inputs = {
+        col: merged_df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        for col in [area_label, 'avg_runoff_coeff', 'prcp_sum', 'ksat']
+    }
+    if scale_inputs:
+        cols_to_scale = ['ksat', 'prcp_sum', area_label]
+        for col in cols_to_scale:
+            score_inputs[col] = _scale_to_1_10(score_inputs[col])
+            merged_df[col] = score_inputs[col]
+
+    # Calculate influence score
+    merged_df['influence_score'] = _influence_score(
+        score_inputs[area_label], score_inputs['avg_runoff_coeff'],
+        score_inputs['prcp_sum'], score_inputs['ksat'],
+        alpha, beta, gamma, omega
+    )
     
-    return current_segment_time + _get_total_travel_time(downstream_id, time_map, to_map)
+    # Normalize to get runoff weight
+    max_influence_score = merged_df['influence_score'].max()
+    merged_df['runoff_weight'] = merged_df['influence_score'] / (max_influence_score + 1e-9)
+    weights_df = merged_df[['flowline_id', 'runoff_weight', 'influence_score']]
+
+    return weights_df
+
+
+def _repeat_values(values: pd.Series, repeats: int, tile: bool = False):
+    """
+    np.repeat (or np.tile) over the values of a Series without building index arrays,
+    keeping nullable-integer and timezone-aware dtypes.
+
+    Args:
+        values (pd.Series): The values to repeat.
+        repeats (int): Number of repetitions.
+        tile (bool): If True, repeat the whole sequence (np.tile); otherwise repeat each element.
+
+    Returns:
+        An array of length len(values) * repeats with the dtype of `values`.
+    """
+    op = np.tile if tile else np.repeat
+    dtype = values.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        utc_values = values.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        return pd.DatetimeIndex(op(utc_values, repeats), tz='UTC').tz_convert(dtype.tz).array
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+        data = op(values.to_numpy(dtype=dtype.numpy_dtype, na_value=0), repeats)
+        mask = op(values.isna().to_numpy(), repeats)
+        return pd.arrays.IntegerArray(data, mask)
+    return op(values.to_numpy(), repeats)
 
 
 def calculate_disaggregated_discharge(
@@ -74,94 +330,60 @@ def calculate_disaggregated_discharge(
           (influence_score, runoff_weight, travel_time_days).
         - final_label: A string label describing the parameters used (e.g., 'A_RC_L1_P_K_TT').
     """
-    flowlines_working_copy = flowlines_gdf.copy()
-    flowlines_working_copy['flowline_id'] = flowlines_working_copy['flowline_id'].astype('Int64')
-    flowlines_working_copy['to_id'] = flowlines_working_copy['to_id'].astype('Int64')
+    id_dtype = narrowest_id_dtype([flowlines_gdf, runoff_gdf, precipitation_df, ksat_df])
+    flowlines_working_copy = normalize_ids(flowlines_gdf.copy(), id_dtype=id_dtype)
 
-    # Select appropriate runoff data and area column
-    runoff_df = runoff_gdf.copy() 
     area_label = 'drainage_area' if use_cumulative_area else 'area_incr'
-    merged_df = runoff_df.merge(ksat_df[['flowline_id', 'ksat']], on='flowline_id', how='left')
-    merged_df = merged_df.merge(precipitation_df, on='flowline_id', how='left')
-    merged_df = merged_df.merge(flowlines_working_copy[['flowline_id', area_label]], on='flowline_id', how='left')
-
-    if scale_inputs:
-        cols_to_scale = ['ksat', 'prcp_sum', area_label]
-        for col in cols_to_scale:
-            min_val = merged_df[col].min()
-            max_val = merged_df[col].max()
-            merged_df[col] = 1 + (merged_df[col] - min_val) * 9 / (max_val - min_val + 1e-9)
-
-    # Calculate influence score
-    merged_df['influence_score'] = (
-        (merged_df[area_label]**alpha) * 
-        (merged_df['avg_runoff_coeff']**beta) * 
-        (merged_df['prcp_sum']**gamma) / 
-        (merged_df['ksat']**omega + 1e-9) 
+    weights_df = _compute_runoff_weights(
+        runoff_gdf, ksat_df, precipitation_df, flowlines_working_copy, area_label,
+        alpha, beta, gamma, omega, scale_inputs
     )
-    
-    # Normalize to get runoff weight
-    max_influence_score = merged_df['influence_score'].max()
-    merged_df['runoff_weight'] = merged_df['influence_score'] / (max_influence_score + 1e-9)
-    weights_df = merged_df[['flowline_id', 'runoff_weight', 'influence_score']]
-    flowlines_with_calcs_gdf = flowlines_working_copy.merge(weights_df, on='flowline_id', how='left')
+    flowline_calcs = [weights_df.set_index('flowline_id')]
 
     # Calculate Travel Time  
     if use_travel_time_dilation:
         if manning_params_df is None:
             warnings.warn("`manning_params_df` not provided. Using hardcoded placeholder values for travel time calculation.")
-            flowlines_with_calcs_gdf['slope'] = 0.01
-            flowlines_with_calcs_gdf['mannings_n'] = 0.02
-            flowlines_with_calcs_gdf['channel_area'] = 10
-            flowlines_with_calcs_gdf['wetted_perimeter'] = 9
-        else:
-            flowlines_with_calcs_gdf = flowlines_with_calcs_gdf.merge(manning_params_df, on='flowline_id', how='left')
-
-        flowlines_with_calcs_gdf['length_m'] = flowlines_with_calcs_gdf.geometry.length
-        flowlines_with_calcs_gdf['hydraulic_radius'] = flowlines_with_calcs_gdf['channel_area'] / flowlines_with_calcs_gdf['wetted_perimeter']
-        flowlines_with_calcs_gdf['velocity_mps'] = (
-            (1 / flowlines_with_calcs_gdf['mannings_n']) *
-            (flowlines_with_calcs_gdf['hydraulic_radius'] ** (2/3)) *
-            (flowlines_with_calcs_gdf['slope'] ** 0.5)
-        )
-        flowlines_with_calcs_gdf['segment_travel_time_s'] = flowlines_with_calcs_gdf['length_m'] / flowlines_with_calcs_gdf['velocity_mps']
-        
-        time_map = flowlines_with_calcs_gdf.set_index('flowline_id')['segment_travel_time_s'].to_dict()
-        to_map = flowlines_with_calcs_gdf.set_index('flowline_id')['to_id'].to_dict()
-
-        flowlines_with_calcs_gdf['total_travel_time_s'] = flowlines_with_calcs_gdf['flowline_id'].apply(
-            lambda fid: _get_total_travel_time(fid, time_map, to_map)
-        )
-        flowlines_with_calcs_gdf['travel_time_days'] = (flowlines_with_calcs_gdf['total_travel_time_s'] / (3600 * 24)).round().astype(int)
-    else:
+        travel_df = _compute_travel_time(flowlines_working_copy, manning_params_df)
+        travel_cols = [col for col in travel_df.columns if col not in flowlines_working_copy.columns]
+        flowline_calcs.append(travel_df.set_index('flowline_id')[travel_cols])
+
+    flowlines_with_calcs_gdf = flowlines_working_copy.join(
+        pd.concat(flowline_calcs, axis=1), on='flowline_id', how='left'
+    ).reset_index(drop=True)
+    if not use_travel_time_dilation:
         flowlines_with_calcs_gdf['travel_time_days'] = 0
 
     # Disaggregate Observed Discharge  
-    disaggregated_results = []
     sorted_outlet_q = outlet_discharge_df.sort_values('time').reset_index(drop=True)
+    weights = flowlines_with_calcs_gdf['runoff_weight']
+    active_pos = np.flatnonzero((weights.notna() & (weights != 0)).to_numpy())
+    active_flowlines = flowlines_with_calcs_gdf.iloc[active_pos]
 
-    for _, flowline_data in flowlines_with_calcs_gdf.iterrows():
-        weight = flowline_data['runoff_weight']
-        lag_days = flowline_data['travel_time_days']
-        fid = flowline_data['flowline_id']
-        
-        if pd.isna(weight) or weight == 0:
-            continue
-            
-        flowline_disaggregated = sorted_outlet_q[['time']].copy()
-        flowline_disaggregated['flowline_id'] = fid
-        
-        # Shift outlet discharge *backwards* by lag_days  
-        shifted_outlet_q = sorted_outlet_q['discharge'].shift(-lag_days)
-        flowline_disaggregated['disaggregated_discharge'] = shifted_outlet_q * weight
-        
-        disaggregated_results.append(flowline_disaggregated)
-
-    final_disaggregated_df = pd.concat(disaggregated_results).fillna(0)
-    final_disaggregated_gdf = gpd.GeoDataFrame(
-        final_disaggregated_df.merge(flowlines_with_calcs_gdf[['flowline_id', 'geometry']], on='flowline_id'),
-        geometry='geometry', crs=flowlines_gdf.crs
-    )
+    n_steps = len(sorted_outlet_q)
+    n_active = len(active_flowlines)
+    discharge = sorted_outlet_q['discharge'].fillna(0).to_numpy(dtype=float)
+    active_weights = active_flowlines['runoff_weight'].to_numpy(dtype=float)
+    lag_days = active_flowlines['travel_time_days'].to_numpy(dtype=int)
+
+    # Output buffer in long format, grouped by flowline; viewed as an (N, T) matrix for filling
+    out_q = np.empty(n_active * n_steps, dtype=np.float64)
+    out_q_matrix = out_q.reshape(n_active, n_steps)
+
+    # Shift outlet discharge *backwards* by lag_days: out_q_matrix[n, t] = discharge[t + lag[n]] * weight[n].
+    # Row k of the sliding-window view is discharge shifted by k days, zero-padded past the record end.
+    max_lag = int(lag_days.max(initial=0))
+    padded_q = np.zeros(n_steps + max_lag, dtype=np.float64)
+    padded_q[:n_steps] = discharge
+    np.take(sliding_window_view(padded_q, n_steps), lag_days, axis=0, out=out_q_matrix)
+    out_q_matrix *= active_weights[:, None]
+
+    # Attach ids and geometry by repeating the active flowline values rather than merging on 'flowline_id'
+    final_disaggregated_gdf = gpd.GeoDataFrame({
+        'time': _repeat_values(sorted_outlet_q['time'], n_active, tile=True),
+        'flowline_id': _repeat_values(active_flowlines['flowline_id'], n_steps),
+        'disaggregated_discharge': out_q
+    }, geometry=np.repeat(active_flowlines.geometry.values.to_numpy(), n_steps), crs=flowlines_gdf.crs, copy=False)
 
     # Label 
     a_lab = 'A' if alpha != 0 else ''
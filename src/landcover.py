@@ -1,15 +1,263 @@
 # landcover.py
+import os
 import geopandas as gpd
 import rasterio
 import numpy as np
+import shapely
 import warnings
-from rasterstats import zonal_stats
-from typing import Literal
+from concurrent.futures import ThreadPoolExecutor
+from rasterio import windows
+from rasterio.features import rasterize
+from typing import Literal, Tuple
+
+
+def _build_runoff_lut(runoff_lookup: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a category code -> runoff coefficient dictionary into dense arrays
+    indexed by category code.
+
+    Args:
+        runoff_lookup (dict): Mapping of integer land cover codes to runoff coefficients.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]:
+        - lut: float64 array where lut[code] is the runoff coefficient (0 for unknown codes).
+        - valid_mask: bool array where valid_mask[code] is True for codes in the lookup.
+    """
+    lut = np.zeros(max(runoff_lookup) + 1, dtype=np.float64)
+    valid_mask = np.zeros_like(lut, dtype=bool)
+    for code, runoff_c in runoff_lookup.items():
+        lut[code] = runoff_c
+        valid_mask[code] = True
+
+    return lut, valid_mask
+
+
+def _processing_windows(src: rasterio.DatasetReader, target_pixels: int = 2**22) -> list:
+    """
+    Splits a raster into processing windows made of whole native blocks.
+
+    Consecutive blocks are merged, first across the row and then down the
+    columns, until a window holds about `target_pixels` pixels. This keeps
+    per-window overhead (rasterize, read, bincount) low for striped GeoTIFFs,
+    whose native blocks are often a single row high.
+
+    Args:
+        src (rasterio.DatasetReader): The open raster.
+        target_pixels (int): Approximate number of pixels per window. Defaults to 4 Mpx.
+
+    Returns:
+        list: `rasterio.windows.Window` objects covering the raster in row-major order.
+    """
+    block_height, block_width = src.block_shapes[0]
+    n_block_cols = max(1, min(-(-src.width // block_width), target_pixels // (block_width * block_height)))
+    window_width = n_block_cols * block_width
+    n_block_rows = max(1, target_pixels // (window_width * block_height))
+    window_height = n_block_rows * block_height
+
+    return [
+        windows.Window(col, row, min(window_width, src.width - col), min(window_height, src.height - row))
+        for row in range(0, src.height, window_height)
+        for col in range(0, src.width, window_width)
+    ]
+
+
+def _non_overlapping_passes(gdf: gpd.GeoDataFrame, has_geometry: np.ndarray) -> np.ndarray:
+    """
+    Assigns each polygon to a rasterization pass so that no two polygons in the
+    same pass have overlapping interiors.
+
+    Burning overlapping polygons into one id raster would hand each shared pixel
+    to only one of them. Splitting them across passes lets every polygon be counted
+    on its own, as per-polygon zonal statistics would. A perfect partition (e.g.
+    incremental divides) needs a single pass.
+
+    Args:
+        gdf (gpd.GeoDataFrame): Polygons in the raster CRS.
+        has_geometry (np.ndarray): Boolean array, False for missing or empty geometries.
+
+    Returns:
+        np.ndarray: Integer pass number (0, 1, ...) for each polygon.
+    """
+    polygon_pass = np.zeros(len(gdf), dtype=np.int64)
+    geometries = gdf.geometry.values.to_numpy()
+    valid_pos = np.flatnonzero(has_geometry)
+
+    left, right = gdf.sindex.query(geometries[valid_pos], predicate='intersects')
+    left = valid_pos[left]
+    keep = left < right
+    left, right = left[keep], right[keep]
+    # Touching boundaries are fine; only shared interiors conflict
+    overlaps = shapely.relate_pattern(geometries[left], geometries[right], 'T********')
+    left, right = left[overlaps], right[overlaps]
+    if not left.size:
+        return polygon_pass
+
+    # Greedy colouring of the overlap graph, in row order
+    neighbors = {}
+    for a, b in zip(left.tolist(), right.tolist()):
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+    for node in sorted(neighbors):
+        taken = {polygon_pass[other] for other in neighbors[node] if other < node}
+        polygon_pass[node] = next(p for p in range(len(taken) + 1) if p not in taken)
+
+    return polygon_pass
+
+
+def _count_blocks(
+    tif_path: str,
+    block_windows: list,
+    block_candidates: list,
+    geometries: np.ndarray,
+    polygon_pass: np.ndarray,
+    valid_mask: np.ndarray
+) -> np.ndarray:
+    """
+    Tallies (polygon, category) pixel counts over a subset of raster blocks.
+
+    Each call opens its own dataset handle, since GDAL handles are not thread-safe.
+
+    Args:
+        tif_path (str): Path to the land classification raster.
+        block_windows (list): The raster block windows to process.
+        block_candidates (list): For each window, positions of the polygons that may intersect it.
+        geometries (np.ndarray): Polygon geometries in the raster CRS.
+        polygon_pass (np.ndarray): Rasterization pass of each polygon; polygons in one
+            pass do not overlap.
+        valid_mask (np.ndarray): Boolean array indexed by category code, True for the codes to count.
+
+    Returns:
+        np.ndarray: Flat array of length (len(geometries) + 1) * len(valid_mask) with pixel counts,
+        where row 0 is the background.
+    """
+    n_categories = len(valid_mask)
+    counts = np.zeros((len(geometries) + 1) * n_categories, dtype=np.int64)
+
+    with rasterio.open(tif_path) as src:
+        for window, candidates in zip(block_windows, block_candidates):
+            codes = src.read(1, window=window).ravel().astype(np.int64)
+            code_valid = (codes >= 0) & (codes < n_categories)
+            in_range = np.flatnonzero(code_valid)
+            code_valid[in_range] = valid_mask[codes[in_range]]
+            if src.nodata is not None:
+                code_valid &= codes != src.nodata
+            if not code_valid.any():
+                continue
+
+            candidate_passes = polygon_pass[candidates]
+            for pass_number in np.unique(candidate_passes):
+                poly_ids = rasterize(
+                    ((geometries[i], i + 1) for i in candidates[candidate_passes == pass_number]),
+                    out_shape=(window.height, window.width),
+                    transform=src.window_transform(window),
+                    fill=0,
+                    all_touched=False,
+                    dtype=np.int32
+                ).ravel()
+
+                valid = code_valid & (poly_ids > 0)
+                if not valid.any():
+                    continue
+
+                keys = poly_ids[valid].astype(np.int64) * n_categories + codes[valid]
+                block_counts = np.bincount(keys)
+                counts[:block_counts.size] += block_counts
+
+    return counts
+
+
+def _count_pixels_by_category(
+    src: rasterio.DatasetReader,
+    gdf: gpd.GeoDataFrame,
+    valid_mask: np.ndarray,
+    n_workers: int = None
+) -> np.ndarray:
+    """
+    Counts land cover pixels of each category inside each polygon.
+
+    The raster is streamed in windows of whole native blocks merged up to
+    about 4 Mpx, so peak memory scales with the window size rather than the
+    full raster and narrow strips are not processed one by one. One bulk
+    STRtree query finds, for every window, the polygons whose bounding box
+    intersects it; only those are rasterized into a polygon-id array for the
+    window (pixel centers, i.e. all_touched=False), and the (polygon,
+    category) pairs are tallied with one bincount. Overlapping polygons are
+    rasterized in separate passes so each one counts every pixel it covers.
+    Each pass is coverage-simplified to half the pixel size first (when
+    Shapely 2.1+ and GEOS 3.12+ are available), which keeps rasterization
+    cheap for divides with dense vertices. Nodata pixels and categories not
+    flagged in `valid_mask` are ignored. Contiguous runs of windows are
+    processed in parallel threads; GDAL reads and rasterization release the
+    GIL.
+
+    Args:
+        src (rasterio.DatasetReader): The open land classification raster.
+        gdf (gpd.GeoDataFrame): Polygons in the raster CRS.
+        valid_mask (np.ndarray): Boolean array indexed by category code, True for
+            the codes to count.
+        n_workers (int, optional): Number of threads. Defaults to the number of CPUs.
+
+    Returns:
+        np.ndarray: Array of shape (len(gdf), len(valid_mask)) with pixel counts.
+    """
+    n_polygons = len(gdf)
+    n_categories = len(valid_mask)
+    geometries = gdf.geometry.values.to_numpy()
+    has_geometry = ~(shapely.is_missing(geometries) | shapely.is_empty(geometries))
+    if not has_geometry.any():
+        return np.zeros((n_polygons, n_categories), dtype=np.int64)
+
+    # Match every block against the spatial index in one bulk query, then group candidates by block
+    block_windows = _processing_windows(src)
+    block_bounds = np.array([windows.bounds(window, src.transform) for window in block_windows])
+    block_boxes = shapely.box(*block_bounds.T)
+    block_idx, poly_idx = gdf.sindex.query(block_boxes)
+    keep = has_geometry[poly_idx]
+    block_idx, poly_idx = block_idx[keep], poly_idx[keep]
+    order = np.argsort(block_idx, kind='stable')
+    block_idx, poly_idx = block_idx[order], poly_idx[order]
+    block_starts = np.searchsorted(block_idx, np.arange(len(block_windows) + 1))
+    polygon_pass = _non_overlapping_passes(gdf, has_geometry)
+
+    # Detail finer than half a pixel barely changes which pixel centers fall inside a polygon,
+    # so drop it before rasterizing (the returned geometries are untouched). Each pass is
+    # simplified as a coverage so shared edges stay shared; simplifying divides one by one
+    # would open slivers between neighbors. Without coverage support (Shapely 2.1+ built
+    # against GEOS 3.12+), keep exact geometries.
+    if hasattr(shapely, 'coverage_simplify') and shapely.geos_version >= (3, 12, 0):
+        tolerance = 0.5 * min(abs(r) for r in src.res)
+        geometries = geometries.copy()
+        for pass_number in np.unique(polygon_pass[has_geometry]):
+            pass_pos = np.flatnonzero(has_geometry & (polygon_pass == pass_number))
+            geometries[pass_pos] = shapely.coverage_simplify(geometries[pass_pos], tolerance)
+
+    # Only blocks that overlap at least one polygon need to be read
+    active_blocks = np.flatnonzero(np.diff(block_starts))
+    block_candidates = [poly_idx[block_starts[b]:block_starts[b + 1]] for b in active_blocks]
+    block_windows = [block_windows[b] for b in active_blocks]
+
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(block_windows)))
+    chunks = np.array_split(np.arange(len(block_windows)), n_workers)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(
+                _count_blocks, src.name,
+                [block_windows[i] for i in chunk], [block_candidates[i] for i in chunk],
+                geometries, polygon_pass, valid_mask
+            )
+            for chunk in chunks
+        ]
+        counts = sum(future.result() for future in futures)
+
+    return counts.reshape(n_polygons + 1, n_categories)[1:]
+
 
 def calculate_average_runoff_coefficient(
     tif_path: str, 
     divides_df: gpd.GeoDataFrame, 
-    level: Literal['level1', 'level2'] = 'level2'
+    level: Literal['level1', 'level2'] = 'level2',
+    n_workers: int = None
 ) -> gpd.GeoDataFrame:
     """
     Calculates the area-weighted average runoff coefficient for each polygon
@@ -17,6 +265,7 @@ def calculate_average_runoff_coefficient(
 
     The calculation can be based on either Level 1 (generalized categories) or 
     Level 2 (detailed categories) of the Anderson Land Cover Classification.
+    Polygons may overlap; each one is evaluated over all the pixels it covers.
 
     Args:
         tif_path (str): 
@@ -30,6 +279,9 @@ def calculate_average_runoff_coefficient(
             'level1' uses broad categories.
             'level2' uses more specific land cover types.
             Defaults to 'level2'.
+        n_workers (int, optional): 
+            Number of threads used to process raster blocks. 
+            Defaults to the number of CPUs.
 
     Returns:
         gpd.GeoDataFrame: 
@@ -94,34 +346,19 @@ def calculate_average_runoff_coefficient(
         if src.crs != gdf.crs:
             warnings.warn(f"GeoDataFrame CRS ({gdf.crs}) does not match TIFF CRS ({src.crs}). Reprojecting GeoDataFrame.")
             gdf = gdf.to_crs(src.crs)
-        nodata_val = src.nodata
-
-    # Fetch pixel counts for each category in each polygon
-    stats = zonal_stats(
-        gdf,
-        tif_path,
-        categorical=True,
-        nodata=nodata_val,
-        all_touched=False  
-    )
-
-    # Calculate the weighted average
-    avg_runoff_coefficients = []
-    for polygon_stats in stats:
-        total_weighted_runoff = 0.0
-        total_pixel_count = 0
-
-        for category_code, pixel_count in polygon_stats.items():
-            runoff_c = runoff_lookup.get(category_code)
-            if runoff_c is not None:
-                total_weighted_runoff += pixel_count * runoff_c
-                total_pixel_count += pixel_count
-        
-        if total_pixel_count > 0:
-            avg_coeff = total_weighted_runoff / total_pixel_count
-            avg_runoff_coefficients.append(avg_coeff)
-        else:
-            avg_runoff_coefficients.append(np.nan)
+
+        # Fetch pixel counts for each category in each polygon
+        runoff_lut, valid_mask = _build_runoff_lut(runoff_lookup)
+        counts = _count_pixels_by_category(src, gdf, valid_mask, n_workers)
+
+    # Calculate the weighted average (counts only hold categories in the lookup)
+    total_weighted_runoff = counts @ runoff_lut
+    total_pixel_count = counts.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_runoff_coefficients = np.where(
+            total_pixel_count > 0, total_weighted_runoff / total_pixel_count, np.nan
+        )
 
     gdf['avg_runoff_coeff'] = avg_runoff_coefficients
 
@@ -1,5 +1,7 @@
 # precipitaiton.py
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from typing import Literal
 
 def process_precipitation_data(
@@ -35,18 +37,27 @@ def process_precipitation_data(
     Raises:
         ValueError: If the 'processing_mode' argument is not 'daily' or 'aggregate'.
     """
-    rain_df['time'] = pd.to_datetime(rain_df['time'])
-    rain_df['time'] = rain_df['time'].dt.tz_localize('UTC', ambiguous='infer')
-    rain_df['time'] = rain_df['time'].dt.normalize()
-
     if processing_mode == 'daily':
+        rain_df['time'] = pd.to_datetime(rain_df['time'], utc=True).dt.normalize()
         return rain_df
     
     elif processing_mode == 'aggregate':
-        rain_df.pop('time')
-        
-        rain_aggregated_df = rain_df.groupby('flowline_id').sum()
-        rain_aggregated_df.reset_index(inplace=True)
+        # 'time' is dropped here, so skip the datetime conversion entirely
+        rain_df = rain_df.drop(columns='time').dropna(subset=['flowline_id'])
+        sum_cols = rain_df.drop(columns='flowline_id').select_dtypes('number').columns
+
+        rain_tbl = pa.Table.from_pandas(rain_df[['flowline_id', *sum_cols]], preserve_index=False)
+        sum_options = pc.ScalarAggregateOptions(min_count=0)
+        rain_aggregated_tbl = rain_tbl.group_by('flowline_id').aggregate(
+            [(col, 'sum', sum_options) for col in sum_cols]
+        )
+
+        rain_aggregated_df = rain_aggregated_tbl.to_pandas()
+        rain_aggregated_df = rain_aggregated_df.rename(columns={f'{col}_sum': col for col in sum_cols})
+        rain_aggregated_df = rain_aggregated_df[['flowline_id', *sum_cols]]
+        rain_aggregated_df = rain_aggregated_df.sort_values('flowline_id', ignore_index=True)
+        # Arrow's group_by drops the pandas metadata; restore the input ID dtype for later joins
+        rain_aggregated_df['flowline_id'] = rain_aggregated_df['flowline_id'].astype(rain_df['flowline_id'].dtype)
         
         return rain_aggregated_df
         
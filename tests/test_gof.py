@@ -3,10 +3,139 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import hydrostats.metrics as he
+
+
+def _compute_metrics(df: pd.DataFrame, measured_col: str, predicted_col: str,
+                     site_id_col: str) -> pd.DataFrame:
+    """
+    Computes NSE, RMSE, MAE, R-squared and the index of agreement for every site
+    with one grouped pass over the data (same definitions as hydrostats.metrics).
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the data.
+        measured_col (str): The name of the column with measured discharge data.
+        predicted_col (str): The name of the column with predicted discharge data.
+        site_id_col (str): The name of the column with the site identifiers.
+
+    Returns:
+        pd.DataFrame: One row of metrics per site, in order of first appearance.
+    """
+    # For calculation, drop any rows where either measured or predicted is NaN/inf
+    obs = df[measured_col].to_numpy(dtype=float)
+    sim = df[predicted_col].to_numpy(dtype=float)
+    valid = np.isfinite(obs) & np.isfinite(sim)
+    eval_df = pd.DataFrame({
+        'site': df[site_id_col].to_numpy()[valid],
+        'obs': obs[valid],
+        'sim': sim[valid]
+    })
+
+    gb = eval_df.groupby('site', sort=False)
+    obs_mean = gb['obs'].transform('mean')
+    obs_anom = eval_df['obs'] - obs_mean
+    sim_anom = eval_df['sim'] - gb['sim'].transform('mean')
+    error = eval_df['sim'] - eval_df['obs']
+
+    terms = pd.DataFrame({
+        'site': eval_df['site'],
+        'sq_err': error**2,
+        'abs_err': error.abs(),
+        'obs_var': obs_anom**2,
+        'sim_var': sim_anom**2,
+        'cov': obs_anom * sim_anom,
+        'agreement': ((eval_df['sim'] - obs_mean).abs() + obs_anom.abs())**2,
+        'n': 1
+    })
+    sums = terms.groupby('site', sort=False).sum().reindex(df[site_id_col].unique())
+
+    return pd.DataFrame({
+        'Site ID': sums.index,
+        'NSE': (1 - sums['sq_err'] / sums['obs_var']).to_numpy(),
+        'RMSE': np.sqrt(sums['sq_err'] / sums['n']).to_numpy(),
+        'MAE': (sums['abs_err'] / sums['n']).to_numpy(),
+        'R-Squared': (sums['cov']**2 / (sums['obs_var'] * sums['sim_var'])).to_numpy(),
+        'Index of Agreement (d)': (1 - sums['sq_err'] / sums['agreement']).to_numpy()
+    })
+
+
+def _plot_site(fig: plt.Figure, site_df: pd.DataFrame, metrics: dict, measured_col: str,
+               predicted_col: str, site_id, label: str, dpi: int = 150) -> None:
+    """
+    Draws the 2x2 goodness-of-fit panel for one site onto `fig` and saves it to 'data/'.
+
+    Args:
+        fig (plt.Figure): Figure to draw on; it is cleared first so it can be reused across sites.
+        site_df (pd.DataFrame): The site's data with a datetime index.
+        metrics (dict): The site's metrics as returned by `_compute_metrics`.
+        measured_col (str): The name of the column with measured discharge data.
+        predicted_col (str): The name of the column with predicted discharge data.
+        site_id: The site identifier, used in the title and file name.
+        label (str): Prefix for the output file name.
+        dpi (int): Resolution of the saved figure.
+    """
+    fig.clf()
+    axs = fig.subplots(2, 2)
+
+    eval_df = site_df[[measured_col, predicted_col]].dropna()
+    measured = eval_df[measured_col]
+    predicted = eval_df[predicted_col]
+
+    fig.suptitle(f'Discharge Goodness-of-Fit Analysis for Site: {site_id}', fontsize=24, y=0.95)
+
+    # Plot 1: Hydrograph Comparison
+    axs[0, 0].plot(site_df.index, site_df[measured_col], label='Measured', color='black', alpha=0.8)
+    axs[0, 0].plot(site_df.index, site_df[predicted_col], label='Calculated', color='crimson', linestyle='--')
+    axs[0, 0].set_title('Hydrograph Comparison', fontsize=16)
+    axs[0, 0].set_xlabel('Date', fontsize=12)
+    axs[0, 0].set_ylabel('Discharge', fontsize=12)
+    axs[0, 0].legend()
+    axs[0, 0].tick_params(axis='x', rotation=45)
+
+    # Plot 2: Scatter Plot of Calculated vs. Measured
+    sns.regplot(x=measured, y=predicted, ax=axs[0, 1], color='darkblue',
+                line_kws={'color': 'red', 'linestyle': '--', 'label': 'Regression Line'},
+                scatter_kws={'alpha': 0.6, 'edgecolor': 'w'})
+    axs[0, 1].plot([measured.min(), measured.max()], [measured.min(), measured.max()], 'k--', label='1:1 Line')
+    axs[0, 1].set_title('Calculated vs. Measured Discharge', fontsize=16)
+    axs[0, 1].set_xlabel('Measured Discharge', fontsize=12)
+    axs[0, 1].set_ylabel('Calculated Discharge', fontsize=12)
+    axs[0, 1].legend()
+    metrics_text = (
+        f"NSE: {metrics['NSE']:.3f}\n"
+        f"MAE: {metrics['MAE']:.3f}\n"
+        f"RMSE: {metrics['RMSE']:.3f}\n"
+        f"R²: {metrics['R-Squared']:.3f}\n"
+        f"Index of Agreement: {metrics['Index of Agreement (d)']:.1f}%"
+    )
+    bbox_props = dict(boxstyle="round,pad=0.5", fc="ivory", ec="black", lw=1, alpha=0.8)
+    axs[0, 1].text(0.05, 0.95, metrics_text, transform=axs[0, 1].transAxes,
+                   fontsize=12, verticalalignment='top', bbox=bbox_props)        
+    axs[0, 1].legend()
+    residuals = measured - predicted
+
+    # Plot 3: Distribution of Residuals
+    sns.histplot(residuals, kde=True, ax=axs[1, 0], color='teal')
+    axs[1, 0].axvline(0, color='red', linestyle='--')
+    axs[1, 0].set_title('Distribution of Residuals', fontsize=16)
+    axs[1, 0].set_xlabel('Residual Value', fontsize=12)
+    axs[1, 0].set_ylabel('Frequency', fontsize=12)
+
+    # Plot 4: Monthly Average Comparison
+    monthly_avg = site_df[[measured_col, predicted_col]].resample('M').mean()
+    monthly_avg.plot(kind='bar', ax=axs[1, 1], color=['black', 'crimson'])
+    axs[1, 1].set_title('Monthly Average Discharge Comparison', fontsize=16)
+    axs[1, 1].set_xlabel('Month', fontsize=12)
+    axs[1, 1].set_ylabel('Average Discharge', fontsize=12)
+    axs[1, 1].set_xticklabels([d.strftime('%Y-%m') for d in monthly_avg.index], rotation=90)
+    axs[1, 1].legend()
+
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.savefig("data/"+label+"_"+str(site_id)+".png", dpi=dpi)
+
 
 def analyze_discharge_goodness_of_fit_compact(df: pd.DataFrame, measured_col: str, predicted_col: str, 
-                                              site_id_col: str, time_col: str, label: str) -> pd.DataFrame:
+                                              site_id_col: str, time_col: str, label: str,
+                                              plot: bool = True, dpi: int = 150) -> pd.DataFrame:
     """
     Computes a set of goodness-of-fit metrics and 
     compare measured and predicted discharge across different sites.
@@ -17,35 +146,15 @@ def analyze_discharge_goodness_of_fit_compact(df: pd.DataFrame, measured_col: st
         predicted_col (str): The name of the column with predicted discharge data.
         site_id_col (str): The name of the column with the site identifiers.
         time_col (str): The name of the column with the timestamp data.
+        plot (bool): If False, only compute the metrics and skip all figures.
+        dpi (int): Resolution of the saved figures; use 300 for publication quality.
     """
-    sns.set_style("whitegrid")
-    plt.rcParams['font.family'] = 'serif'
-
-    site_ids = df[site_id_col].unique()
-    all_metrics = []
+    # Goodness-of-Fit Metrics Calculation
+    metrics_df = _compute_metrics(df, measured_col, predicted_col, site_id_col)
+    metrics_by_site = metrics_df.set_index('Site ID', drop=False).to_dict('index')
 
-    # Loop through each site
-    for site_id in site_ids:
+    for site_id, metrics in metrics_by_site.items():
         print(f"Analyzing Site: {site_id}")
-        site_df = df[df[site_id_col] == site_id].copy()
-        site_df[time_col] = pd.to_datetime(site_df[time_col])
-        site_df = site_df.set_index(time_col)
-
-        # Goodness-of-Fit Metrics Calculation
-        # For calculation, drop any rows where either measured or predicted is NaN
-        eval_df = site_df[[measured_col, predicted_col]].dropna()
-        measured = eval_df[measured_col]
-        predicted = eval_df[predicted_col]
-
-        metrics = {
-            'Site ID': site_id,
-            'NSE': he.nse(predicted, measured),
-            'RMSE': he.rmse(predicted, measured),
-            'MAE': he.mae(predicted, measured),
-            'R-Squared': he.r_squared(predicted, measured),
-            'Index of Agreement (d)': he.d(predicted, measured)
-        }
-        all_metrics.append(metrics)
         
         # Print the metrics for the current site
         print("\nGoodness-of-Fit Metrics:")
@@ -53,62 +162,22 @@ def analyze_discharge_goodness_of_fit_compact(df: pd.DataFrame, measured_col: st
             if isinstance(value, float):
                 print(f"{key}: {value:.3f}")
 
+    if plot:
+        sns.set_style("whitegrid")
+        plt.rcParams['font.family'] = 'serif'
+
+        df = df.copy()
+        df[time_col] = pd.to_datetime(df[time_col])
+
+        fig = None
+        for site_id, site_df in df.groupby(site_id_col, sort=False):
+            # Reuse one figure across sites unless it was closed (e.g. by an inline backend)
+            if fig is None or not plt.fignum_exists(fig.number):
+                fig = plt.figure(figsize=(20, 12))
+            _plot_site(fig, site_df.set_index(time_col), metrics_by_site[site_id],
+                       measured_col, predicted_col, site_id, label, dpi)
+            plt.show()
 
-        fig, axs = plt.subplots(2, 2, figsize=(20, 12))
-        fig.suptitle(f'Discharge Goodness-of-Fit Analysis for Site: {site_id}', fontsize=24, y=0.95)
-
-        # Plot 1: Hydrograph Comparison
-        axs[0, 0].plot(site_df.index, site_df[measured_col], label='Measured', color='black', alpha=0.8)
-        axs[0, 0].plot(site_df.index, site_df[predicted_col], label='Calculated', color='crimson', linestyle='--')
-        axs[0, 0].set_title('Hydrograph Comparison', fontsize=16)
-        axs[0, 0].set_xlabel('Date', fontsize=12)
-        axs[0, 0].set_ylabel('Discharge', fontsize=12)
-        axs[0, 0].legend()
-        axs[0, 0].tick_params(axis='x', rotation=45)
-
-        # Plot 2: Scatter Plot of Calculated vs. Measured
-        sns.regplot(x=measured, y=predicted, ax=axs[0, 1], color='darkblue',
-                    line_kws={'color': 'red', 'linestyle': '--', 'label': 'Regression Line'},
-                    scatter_kws={'alpha': 0.6, 'edgecolor': 'w'})
-        axs[0, 1].plot([measured.min(), measured.max()], [measured.min(), measured.max()], 'k--', label='1:1 Line')
-        axs[0, 1].set_title('Calculated vs. Measured Discharge', fontsize=16)
-        axs[0, 1].set_xlabel('Measured Discharge', fontsize=12)
-        axs[0, 1].set_ylabel('Calculated Discharge', fontsize=12)
-        axs[0, 1].legend()
-        metrics_text = (
-            f"NSE: {metrics['NSE']:.3f}\n"
-            f"MAE: {metrics['MAE']:.3f}\n"
-            f"RMSE: {metrics['RMSE']:.3f}\n"
-            f"R²: {metrics['R-Squared']:.3f}\n"
-            f"Index of Agreement: {metrics['Index of Agreement (d)']:.1f}%"
-        )
-        bbox_props = dict(boxstyle="round,pad=0.5", fc="ivory", ec="black", lw=1, alpha=0.8)
-        axs[0, 1].text(0.05, 0.95, metrics_text, transform=axs[0, 1].transAxes,
-                       fontsize=12, verticalalignment='top', bbox=bbox_props)        
-        axs[0, 1].legend()
-        residuals = measured - predicted
-
-        # Plot 3: Distribution of Residuals
-        sns.histplot(residuals, kde=True, ax=axs[1, 0], color='teal')
-        axs[1, 0].axvline(0, color='red', linestyle='--')
-        axs[1, 0].set_title('Distribution of Residuals', fontsize=16)
-        axs[1, 0].set_xlabel('Residual Value', fontsize=12)
-        axs[1, 0].set_ylabel('Frequency', fontsize=12)
-
-        # Plot 4: Monthly Average Comparison
-        monthly_avg = site_df[[measured_col, predicted_col]].resample('M').mean()
-        monthly_avg.plot(kind='bar', ax=axs[1, 1], color=['black', 'crimson'])
-        axs[1, 1].set_title('Monthly Average Discharge Comparison', fontsize=16)
-        axs[1, 1].set_xlabel('Month', fontsize=12)
-        axs[1, 1].set_ylabel('Average Discharge', fontsize=12)
-        axs[1, 1].set_xticklabels([d.strftime('%Y-%m') for d in monthly_avg.index], rotation=90)
-        axs[1, 1].legend()
-
-        plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-        plt.savefig("data/"+label+"_"+site_id+".png", dpi=300)
-        plt.show()
-
-    metrics_df = pd.DataFrame(all_metrics)
     print("\nSummary of Goodness-of-Fit Metrics Across All Sites:")
     print(metrics_df.to_string())
     return metrics_df
\ No newline at end of file